@@ -1,20 +1,39 @@
 import os
+import re
+import json
+import orjson
+import asyncio
+import threading
 import swisseph as swe
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, date
+from zoneinfo import ZoneInfo
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import Optional, List, Dict, Any
-import pytz
 import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, field_validator
 
 # --- Auto-Location ---
 from geopy.geocoders import Nominatim
+from geopy.adapters import AioHTTPAdapter
+from geopy.extra.rate_limiter import AsyncRateLimiter
 from timezonefinder import TimezoneFinder
 
+# --- Optional shared cache ---
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
 # --- 1. Configuration & Logging ---
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +43,21 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000") # Security Lock
 MAX_QUESTIONS = int(os.getenv("MAX_QUESTIONS", 3))
+# Optional answer-length cap. Unset by default: on thinking models it also counts reasoning tokens,
+# so a small cap can end a reply before any text is produced.
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS")) if os.getenv("MAX_OUTPUT_TOKENS") else None
+MAX_BATCH_CHARTS = int(os.getenv("MAX_BATCH_CHARTS", 12))
+WORKERS = int(os.getenv("WORKERS", min(4, os.cpu_count() or 1)))
+# Each uvicorn worker gets its own pool, so split the cores between them
+BATCH_PROCESSES = max(1, (os.cpu_count() or 1) // WORKERS)
+REDIS_URL = os.getenv("REDIS_URL") # Optional: share geo cache across workers
+PUBLIC_NOMINATIM = "nominatim.openstreetmap.org"
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", PUBLIC_NOMINATIM) # Point at a local mirror if you run one
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https") # Local mirrors usually serve plain http
+GEOCODE_MIN_DELAY = float(os.getenv("GEOCODE_MIN_DELAY", 1.0)) # Public Nominatim allows 1 request/second
+# Every uvicorn worker has its own limiter, so on the public host stretch each worker's gap by WORKERS
+# to keep the whole server at one request per GEOCODE_MIN_DELAY. Self-hosted mirrors get the delay per worker.
+GEOCODE_WORKER_DELAY = GEOCODE_MIN_DELAY * WORKERS if NOMINATIM_DOMAIN == PUBLIC_NOMINATIM else GEOCODE_MIN_DELAY
 
 # --- 2. Robust AI Initialization (From your snippet) ---
 ai_model = None
@@ -51,10 +85,32 @@ else:
         logger.error(f"Failed to configure Gemini: {e}")
 
 # --- 3. FastAPI Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the ephemeris and TimezoneFinder's lazily loaded data side by side
+    await asyncio.gather(asyncio.to_thread(warm_ephemeris), asyncio.to_thread(_timezone_at, 28.61, 77.21))
+    app.state.redis = _connect_redis()
+    try:
+        # Process pool for /batch_charts; worker processes are only started on first use
+        with ProcessPoolExecutor(max_workers=BATCH_PROCESSES) as pool:
+            # One geocoder (and one aiohttp session) per worker, so lookups reuse keep-alive connections
+            async with Nominatim(user_agent="vedic_astro_secure", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME, timeout=10, adapter_factory=AioHTTPAdapter) as geolocator:
+                app.state.pool = pool
+                app.state.geolocator = geolocator
+                # All live lookups in this worker go through one limiter; see GEOCODE_WORKER_DELAY for the server-wide rate
+                app.state.geocode = AsyncRateLimiter(
+                    geolocator.geocode, min_delay_seconds=GEOCODE_WORKER_DELAY, max_retries=0, swallow_exceptions=False
+                )
+                yield
+    finally:
+        if app.state.redis: await app.state.redis.aclose()
+
 app = FastAPI(
     title="Vedic Astrology API (Secure)", 
     version="18.0.0",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse # Faster serialization of the nested chart payload
 )
 
 # --- 4. CORS Security (Only Specific Frontend) ---
@@ -72,11 +128,24 @@ swe.set_ephe_path(EPHEMERIS_PATH)
 PLANET_FLAGS = swe.FLG_SIDEREAL
 HOUSE_FLAGS = swe.FLG_SIDEREAL
 SIDEREAL_YEAR = 365.256363004
+# Fixed-point longitude: 27 nakshatras x 4 padas = 108 padas per circle, each split into 2**PADA_SHIFT units
+PADA_SHIFT = 32
+PADA_SCALE = (108 / 360.0) * (1 << PADA_SHIFT)
+NAK_UNITS = 4 << PADA_SHIFT
 
 SIGNS = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
 DASHA_SEQ = ["Ketu", "Venus", "Sun", "Moon", "Mars", "Rahu", "Jupiter", "Saturn", "Mercury"]
 DASHA_YEARS = { "Ketu": 7, "Venus": 20, "Sun": 6, "Moon": 10, "Mars": 7, "Rahu": 18, "Jupiter": 16, "Saturn": 19, "Mercury": 17 }
 
+# Precomputed Dasha tables (indexed by position in DASHA_SEQ), durations in days
+DASHA_IDX = {lord: i for i, lord in enumerate(DASHA_SEQ)}
+DASHA_DAYS = tuple(DASHA_YEARS[lord] * SIDEREAL_YEAR for lord in DASHA_SEQ)
+# ANTAR_DAYS[m][j] = length of the j-th Antardasha inside the Mahadasha of DASHA_SEQ[m]
+ANTAR_DAYS = tuple(
+    tuple(DASHA_DAYS[m] * DASHA_YEARS[DASHA_SEQ[(m + j) % 9]] / 120.0 for j in range(9))
+    for m in range(9)
+)
+
 NAKSHATRA_NAMES = [
     "Ashwini", "Bharani", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu", "Pushya", "Ashlesha",
     "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta", "Chitra", "Swati", "Vishakha", "Anuradha", "Jyeshtha",
@@ -87,6 +156,9 @@ PLANET_MAPPING = {
     "Sun": swe.SUN, "Moon": swe.MOON, "Mars": swe.MARS, "Mercury": swe.MERCURY,
     "Jupiter": swe.JUPITER, "Venus": swe.VENUS, "Saturn": swe.SATURN, "Rahu": swe.MEAN_NODE
 }
+PLANET_NAMES = tuple(PLANET_MAPPING) + ("Ketu",)
+PLANET_IDS = np.array(list(PLANET_MAPPING.values()), dtype=np.int32)
+MOON_I, RAHU_I, KETU_I = (PLANET_NAMES.index(p) for p in ("Moon", "Rahu", "Ketu"))
 
 FUNCTIONAL_MALEFICS = {
     0: ["Mercury", "Saturn", "Rahu", "Ketu"], 1: ["Venus", "Jupiter", "Moon", "Rahu", "Ketu"],
@@ -109,8 +181,31 @@ STRENGTH_CHART = {
     "Ketu": {"exalt": "Scorpio", "debilit": "Taurus", "own": ["Scorpio"]}
 }
 
+# Integer encodings of the tables above for the dignity kernel (indexed by position in PLANET_NAMES).
+# Plain int tuples rather than NumPy arrays, which avoids NumPy scalar overhead on every lookup.
+SIGN_IDX = {sign: i for i, sign in enumerate(SIGNS)}
+PLANET_IDX = {name: i for i, name in enumerate(PLANET_NAMES)}
+EXALT_SIGN = tuple(SIGN_IDX[STRENGTH_CHART[p]["exalt"]] for p in PLANET_NAMES)
+DEBIL_SIGN = tuple(SIGN_IDX[STRENGTH_CHART[p]["debilit"]] for p in PLANET_NAMES)
+OWN_MASK = tuple(sum(1 << SIGN_IDX[s] for s in STRENGTH_CHART[p]["own"]) for p in PLANET_NAMES)
+# MALEFIC_MASK[asc] has bit p set when PLANET_NAMES[p] is a functional malefic for that ascendant
+MALEFIC_MASK = tuple(sum(1 << PLANET_IDX[p] for p in FUNCTIONAL_MALEFICS[a]) for a in range(12))
+NODE_MASK = (1 << RAHU_I) | (1 << KETU_I)
+STRENGTH_NAMES = ("Neutral", "Exalted", "Debilitated", "Own Sign")
+NATURE_NAMES = ("Functional Benefic", "Functional Malefic", "Natural Malefic")
+
+# Per-chart planet table, one row per PLANET_NAMES entry; decoded to response dicts only at the end
+PLANET_DTYPE = np.dtype([
+    ("sign", np.int8), ("house", np.int8), ("nak", np.int8), ("pada", np.int8),
+    ("lon", np.float64), ("strength", np.int8), ("nature", np.int8)
+])
+
 # --- Pydantic Models ---
 
+# re.ASCII: plain \d also matches non-ASCII digits, which strptime later rejects
+_DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})", re.ASCII)
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{1,2})", re.ASCII)
+
 class BirthData(BaseModel):
     date: str
     time: str
@@ -126,22 +221,20 @@ class BirthData(BaseModel):
     @field_validator('date')
     def validate_date(cls, v):
         v = v.replace('-', '/')
+        m = _DATE_RE.fullmatch(v)
         try:
-            datetime.strptime(v, "%d/%m/%Y")
+            if not m: raise ValueError
+            datetime(int(m[3]), int(m[2]), int(m[1])) # Rejects impossible dates like 31/02
             return v
         except ValueError:
             raise ValueError("Invalid date format. Please use DD/MM/YYYY")
 
     @field_validator('time')
     def validate_time(cls, v):
-        try:
-            parts = v.split(':')
-            if len(parts) == 2:
-                h, m = int(parts[0]), int(parts[1])
-                return f"{h:02d}:{m:02d}"
-            return v
-        except:
+        m = _TIME_RE.fullmatch(v)
+        if not m or int(m[1]) > 23 or int(m[2]) > 59:
             raise ValueError("Invalid time format. Please use HH:MM")
+        return f"{int(m[1]):02d}:{int(m[2]):02d}"
 
 class ChatMessage(BaseModel):
     role: str
@@ -152,199 +245,314 @@ class ChatRequest(BaseModel):
     question: str
     history: List[ChatMessage] = []
 
-geolocator = Nominatim(user_agent="vedic_astro_secure", timeout=10)
-tf = TimezoneFinder()
+# ~40 MB of polygon data in RAM instead of per-lookup file reads. This is for speed only: in-memory mode
+# still seeks/reads shared buffers and is not thread-safe, so only call it via _timezone_at (which locks).
+tf = TimezoneFinder(in_memory=True)
+
+# --- Geo Cache (in-process LRU + optional Redis) ---
+GEO_CACHE_SIZE = 4096
+GEO_CACHE_TTL = 48 * 3600
+REDIS_TIMEOUT = 0.5 # Seconds; an unreachable Redis should fall through to the live lookup quickly
+_geo_cache = OrderedDict()
+_geo_inflight = {} # key -> Task, so concurrent misses for the same city share one live lookup (per worker)
+
+def _connect_redis():
+    if not REDIS_URL: return None
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but the 'redis' package is not installed. Using in-process cache only.")
+        return None
+    return aioredis.from_url(REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+
+async def _cache_get(key):
+    if key in _geo_cache:
+        _geo_cache.move_to_end(key)
+        return _geo_cache[key]
+    redis_client = app.state.redis
+    if redis_client:
+        try:
+            raw = await redis_client.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                _cache_put_local(key, value)
+                return value
+        except Exception as e:
+            logger.warning(f"Redis read failed: {e}")
+    return None
+
+def _cache_put_local(key, value):
+    _geo_cache[key] = value
+    _geo_cache.move_to_end(key)
+    if len(_geo_cache) > GEO_CACHE_SIZE:
+        _geo_cache.popitem(last=False)
+
+async def _cache_set(key, value):
+    _cache_put_local(key, value)
+    redis_client = app.state.redis
+    if redis_client:
+        try:
+            await redis_client.setex(key, GEO_CACHE_TTL, json.dumps(value))
+        except Exception as e:
+            logger.warning(f"Redis write failed: {e}")
+
+async def _geocode_live(city, key):
+    loc = await app.state.geocode(city)
+    if not loc: return None
+    await _cache_set(key, {"lat": loc.latitude, "lon": loc.longitude})
+    return loc.latitude, loc.longitude
+
+async def _geocode(city):
+    key = f"geo:{city.strip().lower()}"
+    cached = await _cache_get(key)
+    if cached: return cached["lat"], cached["lon"]
+    task = _geo_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_geocode_live(city, key))
+        _geo_inflight[key] = task
+        task.add_done_callback(lambda _: _geo_inflight.pop(key, None))
+    # shield: one cancelled request must not cancel the lookup other requests are waiting on
+    return await asyncio.shield(task)
+
+# TimezoneFinder reads its data through shared handles (seek + read), so lookups must not overlap
+_tf_lock = threading.Lock()
+
+@lru_cache(maxsize=GEO_CACHE_SIZE)
+def _timezone_at(lat, lon):
+    # Callers round to 2 decimals (~1 km) so nearby births share an entry
+    with _tf_lock:
+        return tf.timezone_at(lng=lon, lat=lat)
 
 # --- Endpoints ---
 
 @app.get("/search_city")
-def search_city(query: str = Query(..., min_length=3)):
+async def search_city(query: str = Query(..., min_length=3)):
     try:
-        locations = geolocator.geocode(query, exactly_one=False, limit=5, language='en')
+        key = f"search:{query.strip().lower()}"
+        cached = await _cache_get(key)
+        if cached: return cached
+        locations = await app.state.geocode(query, exactly_one=False, limit=5, language='en')
         if not locations: return []
-        return [{"name": loc.address, "lat": loc.latitude, "lon": loc.longitude} for loc in locations]
+        results = [{"name": loc.address, "lat": loc.latitude, "lon": loc.longitude} for loc in locations]
+        await _cache_set(key, results)
+        return results
     except Exception as e:
         logger.error(f"Geo Error: {e}")
         return []
 
-def get_location_and_jd(data: BirthData):
+async def get_location_and_jd(data: BirthData):
     lat, lon, tz = data.lat, data.lon, data.timezone
 
     if data.city and (not lat or lat == 0 or not lon or lon == 0):
         try:
-            loc = geolocator.geocode(data.city)
+            loc = await _geocode(data.city)
             if not loc: raise HTTPException(404, detail="City not found")
-            lat, lon = loc.latitude, loc.longitude
+            lat, lon = loc
         except Exception:
             raise HTTPException(500, detail="Geocoding unavailable")
     
     if lat is None or lon is None: raise HTTPException(400, detail="Need City or Lat/Lon")
 
+    local_dt = datetime.strptime(f"{data.date} {data.time}", "%d/%m/%Y %H:%M")
+
     if tz is None or tz == 0:
         try:
-            tz_str = tf.timezone_at(lng=lon, lat=lat) or "UTC"
-            local_tz = pytz.timezone(tz_str)
-            dt_obj = datetime.strptime(f"{data.date} {data.time}", "%d/%m/%Y %H:%M")
-            tz = local_tz.localize(dt_obj).utcoffset().total_seconds() / 3600.0
-        except:
+            # Point-in-polygon lookup is CPU work; keep it off the event loop on cache misses
+            tz_str = await asyncio.to_thread(_timezone_at, round(lat, 2), round(lon, 2)) or "UTC"
+            tz = local_dt.replace(tzinfo=ZoneInfo(tz_str)).utcoffset().total_seconds() / 3600.0
+        except Exception as e:
+            logger.warning(f"Timezone lookup failed, assuming UTC: {e}")
             tz = 0.0
 
-    t_str = data.time + ":00"
-    dt_str = f"{data.date} {t_str}"
-    local_dt = datetime.strptime(dt_str, "%d/%m/%Y %H:%M:%S")
-    utc_dt = local_dt - timedelta(hours=tz)
-    utc_hour = utc_dt.hour + (utc_dt.minute/60.0) + (utc_dt.second/3600.0)
-    jd = swe.julday(utc_dt.year, utc_dt.month, utc_dt.day, utc_hour)
+    # Shift to UT; divmod rolls the date when the offset crosses midnight
+    day_shift, utc_hour = divmod(local_dt.hour + local_dt.minute / 60.0 - tz, 24)
+    utc_date = date.fromordinal(local_dt.toordinal() + int(day_shift))
+    jd = swe.julday(utc_date.year, utc_date.month, utc_date.day, utc_hour)
     
     return jd, local_dt, lat, lon, tz
 
+def _zodiac_raw(deg):
+    # Returns (sign index, nakshatra index, pada, fraction of nakshatra elapsed) from one fixed-point conversion
+    units = int(deg * PADA_SCALE)
+    pada_abs = units >> PADA_SHIFT
+    return pada_abs // 9, pada_abs >> 2, (pada_abs & 3) + 1, (units % NAK_UNITS) / NAK_UNITS
+
+def _dignity_raw(p_idx, sign_idx, asc_idx):
+    # Returns (STRENGTH_NAMES index, NATURE_NAMES index)
+    strength = 0
+    if sign_idx == EXALT_SIGN[p_idx]: strength = 1
+    elif sign_idx == DEBIL_SIGN[p_idx]: strength = 2
+    elif (OWN_MASK[p_idx] >> sign_idx) & 1: strength = 3
+    bit = 1 << p_idx
+    nature = 2 if NODE_MASK & bit else (MALEFIC_MASK[asc_idx] >> p_idx) & 1
+    return strength, nature
+
 def get_nakshatra(deg):
-    span = 13.333333333
-    idx = int(deg / span)
-    deg_in_nak = deg % span
-    pada = int(deg_in_nak / (span / 4)) + 1
+    _, idx, pada, fraction = _zodiac_raw(deg)
     return {
         "name": NAKSHATRA_NAMES[idx % 27],
         "lord": DASHA_SEQ[idx % 9],
         "pada": pada,
-        "fraction": deg_in_nak / span
+        "fraction": fraction
     }
 
-def get_dignity(planet_name, sign_name, asc_idx):
-    status = "Neutral"
-    if planet_name in STRENGTH_CHART:
-        r = STRENGTH_CHART[planet_name]
-        if sign_name == r["exalt"]: status = "Exalted"
-        elif sign_name == r["debilit"]: status = "Debilitated"
-        elif sign_name in r["own"]: status = "Own Sign"
-    is_malefic = planet_name in FUNCTIONAL_MALEFICS.get(asc_idx, [])
-    nature = "Functional Malefic" if is_malefic else "Functional Benefic"
-    if planet_name in ["Rahu", "Ketu"]: nature = "Natural Malefic"
-    return status, nature
+def _ordinal_to_str(day):
+    # Same output as strftime("%d-%m-%Y"), at a fraction of the cost (~200 calls per chart)
+    d = date.fromordinal(int(day))
+    return f"{d.day:02d}-{d.month:02d}-{d.year}"
 
 class VimshottariTimeline:
     def __init__(self, moon_deg, birth_date):
         self.nak = get_nakshatra(moon_deg)
         self.birth_date = birth_date
         
-    def add_time(self, dt, years):
-        return dt + timedelta(days=years * SIDEREAL_YEAR)
-        
     def generate(self):
-        total_yrs = DASHA_YEARS[self.nak['lord']]
-        passed_fraction = self.nak['fraction']
-        passed_years = total_yrs * passed_fraction
-        theoretical_start = self.add_time(self.birth_date, -passed_years)
+        # All arithmetic is on fractional day ordinals; dates are only materialized for output
+        bd = self.birth_date
+        birth_day = bd.toordinal() + (bd.hour * 3600 + bd.minute * 60 + bd.second) / 86400.0
+        start_idx = DASHA_IDX[self.nak['lord']]
         timeline = []
-        curr_maha_start = theoretical_start
-        start_idx = DASHA_SEQ.index(self.nak['lord'])
+        curr_maha_start = birth_day - DASHA_DAYS[start_idx] * self.nak['fraction']
         
         for i in range(12):
-            m_lord = DASHA_SEQ[(start_idx + i) % 9]
-            m_duration = DASHA_YEARS[m_lord]
-            m_end = self.add_time(curr_maha_start, m_duration)
-            if m_end < self.birth_date:
+            m_idx = (start_idx + i) % 9
+            m_end = curr_maha_start + DASHA_DAYS[m_idx]
+            if m_end < birth_day:
                 curr_maha_start = m_end
                 continue
             antardashas = []
             curr_antar = curr_maha_start
-            sub_idx = DASHA_SEQ.index(m_lord)
-            for j in range(9):
-                a_lord = DASHA_SEQ[(sub_idx + j) % 9]
-                a_dur = (m_duration * DASHA_YEARS[a_lord]) / 120.0
-                a_end = self.add_time(curr_antar, a_dur)
-                if a_end > self.birth_date:
+            for j, a_days in enumerate(ANTAR_DAYS[m_idx]):
+                a_end = curr_antar + a_days
+                if a_end > birth_day:
                     antardashas.append({
-                        "lord": a_lord,
-                        "start": max(self.birth_date, curr_antar).strftime("%d-%m-%Y"),
-                        "end": a_end.strftime("%d-%m-%Y")
+                        "lord": DASHA_SEQ[(m_idx + j) % 9],
+                        "start": _ordinal_to_str(max(birth_day, curr_antar)),
+                        "end": _ordinal_to_str(a_end)
                     })
                 curr_antar = a_end
             timeline.append({
-                "lord": m_lord,
-                "start": max(self.birth_date, curr_maha_start).strftime("%d-%m-%Y"),
-                "end": m_end.strftime("%d-%m-%Y"),
+                "lord": DASHA_SEQ[m_idx],
+                "start": _ordinal_to_str(max(birth_day, curr_maha_start)),
+                "end": _ordinal_to_str(m_end),
                 "antardashas": antardashas
             })
             curr_maha_start = m_end
-            if curr_maha_start.year > (self.birth_date.year + 110): break
+            if date.fromordinal(int(m_end)).year > (bd.year + 110): break
         return timeline
 
-@app.post("/calculate_chart")
-def calculate_chart(data: BirthData):
-    try:
-        jd, local_dt, lat, lon, tz = get_location_and_jd(data)
+_swe_thread = threading.local()
+
+def _ensure_ephemeris():
+    # Swiss Ephemeris settings are thread-local, so each worker thread is configured once
+    if not getattr(_swe_thread, "ready", False):
+        swe.set_ephe_path(EPHEMERIS_PATH)
         swe.set_sid_mode(swe.SIDM_LAHIRI)
-        
-        cusps, ascmc = swe.houses_ex(jd, lat, lon, b'A', flags=HOUSE_FLAGS)
-        asc_deg = ascmc[0]
-        asc_idx = int(asc_deg / 30)
-        
-        planets = []
-        for name, pid in PLANET_MAPPING.items():
-            xx, _ = swe.calc_ut(jd, pid, PLANET_FLAGS)
-            lon_deg = xx[0]
-            sign_name = SIGNS[int(lon_deg / 30)]
-            house = ((int(lon_deg/30) - asc_idx + 12) % 12) + 1
-            nak = get_nakshatra(lon_deg)
-            strength, nature = get_dignity(name, sign_name, asc_idx)
-            planets.append({
-                "name": name, "sign": sign_name, "house": house,
-                "strength": strength, "nature": nature,
-                "nakshatra": nak["name"], "nakshatra_lord": nak["lord"], "nakshatra_pada": nak["pada"],
-                "full_degree": lon_deg
-            })
+        _swe_thread.ready = True
+
+def warm_ephemeris():
+    # Touch every body once so ephemeris data is loaded before the first real request
+    _ensure_ephemeris()
+    jd = swe.julday(2024, 1, 1, 0)
+    for pid in PLANET_MAPPING.values():
+        swe.calc_ut(jd, pid, PLANET_FLAGS)
+    swe.houses_ex(jd, 0, 0, b'A', flags=HOUSE_FLAGS)
+
+def _compute_chart(jd, local_dt, lat, lon):
+    # Pure CPU work (Swiss Ephemeris + Dasha); run off the event loop via asyncio.to_thread
+    _ensure_ephemeris()
+    cusps, ascmc = swe.houses_ex(jd, lat, lon, b'A', flags=HOUSE_FLAGS)
+    asc_deg = ascmc[0]
+    asc_idx = int(asc_deg / 30)
+    
+    # One ephemeris call per body, then sign/house/nakshatra for all nine in a single vectorized pass
+    lons = np.empty(len(PLANET_NAMES))
+    for i, pid in enumerate(PLANET_IDS):
+        lons[i] = swe.calc_ut(jd, int(pid), PLANET_FLAGS)[0][0]
+    lons[KETU_I] = (lons[RAHU_I] + 180) % 360
+
+    # Same fixed-point scheme as _zodiac_raw, applied to the whole array
+    pada_abs = (lons * PADA_SCALE).astype(np.int64) >> PADA_SHIFT
+    rec = np.empty(len(PLANET_NAMES), dtype=PLANET_DTYPE)
+    rec["lon"] = lons
+    rec["sign"] = pada_abs // 9
+    rec["house"] = (rec["sign"] - asc_idx) % 12 + 1
+    rec["nak"] = pada_abs >> 2
+    rec["pada"] = (pada_abs & 3) + 1
+    for i, s_i in enumerate(rec["sign"].tolist()):
+        rec["strength"][i], rec["nature"][i] = _dignity_raw(i, s_i, asc_idx)
+
+    planets = [
+        {
+            "name": name, "sign": SIGNS[s_i], "house": house,
+            "strength": STRENGTH_NAMES[st], "nature": NATURE_NAMES[nt],
+            "nakshatra": NAKSHATRA_NAMES[n_i % 27], "nakshatra_lord": DASHA_SEQ[n_i % 9], "nakshatra_pada": pada,
+            "full_degree": lon_deg
+        }
+        for name, (s_i, house, n_i, pada, lon_deg, st, nt) in zip(PLANET_NAMES, rec.tolist())
+    ]
+
+    moon = planets[MOON_I] # planets is built in PLANET_NAMES order
+    timeline = VimshottariTimeline(moon["full_degree"], local_dt).generate()
+
+    buckets = [[] for _ in range(12)]
+    for p in planets:
+        buckets[p["house"] - 1].append(p)
+    chart = {f"house_{h + 1}": { "sign": SIGNS[(asc_idx + h) % 12], "planets": buckets[h] } for h in range(12)}
 
-        rahu = next(p for p in planets if p["name"] == "Rahu")
-        ketu_deg = (rahu["full_degree"] + 180) % 360
-        ketu_sign = SIGNS[int(ketu_deg / 30)]
-        k_str, k_nat = get_dignity("Ketu", ketu_sign, asc_idx)
-        k_nak = get_nakshatra(ketu_deg)
-        planets.append({
-            "name": "Ketu", "sign": ketu_sign, "house": ((int(ketu_deg/30) - asc_idx + 12) % 12) + 1,
-            "strength": k_str, "nature": k_nat,
-            "nakshatra": k_nak["name"], "nakshatra_lord": k_nak["lord"], "nakshatra_pada": k_nak["pada"],
-            "full_degree": ketu_deg
-        })
-
-        moon = next(p for p in planets if p["name"] == "Moon")
-        timeline = VimshottariTimeline(moon["full_degree"], local_dt).generate()
-
-        chart = {}
-        for h in range(1, 13):
-            sign_nm = SIGNS[(asc_idx + h - 1) % 12]
-            pls = [p for p in planets if p["house"] == h]
-            chart[f"house_{h}"] = { "sign": sign_nm, "planets": pls }
+    return {
+        "ascendant": { "sign": SIGNS[asc_idx], "degree": asc_deg },
+        "moon_intelligence": { "nakshatra": moon["nakshatra"], "pada": moon["nakshatra_pada"], "sign": moon["sign"], "strength": moon["strength"] },
+        "vimshottari_timeline": timeline,
+        "chart_data": chart
+    }
 
+@app.post("/calculate_chart")
+async def calculate_chart(data: BirthData):
+    try:
+        jd, local_dt, lat, lon, tz = await get_location_and_jd(data)
+        chart_core = await asyncio.to_thread(_compute_chart, jd, local_dt, lat, lon)
         return {
             "location": { "city": data.city, "lat": lat, "lon": lon, "tz": tz },
-            "ascendant": { "sign": SIGNS[asc_idx], "degree": asc_deg },
-            "moon_intelligence": { "nakshatra": moon["nakshatra"], "pada": moon["nakshatra_pada"], "sign": moon["sign"], "strength": moon["strength"] },
-            "vimshottari_timeline": timeline,
-            "chart_data": chart
+            **chart_core
         }
     except Exception as e:
         logger.error(f"Calc Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/chat_with_astrologer")
-def chat_with_astrologer(request: ChatRequest):
-    if not ai_model:
-        raise HTTPException(status_code=503, detail="AI Service is currently unavailable. Please check API Key.")
+@app.post("/batch_charts")
+async def batch_charts(data: List[BirthData]):
+    if len(data) > MAX_BATCH_CHARTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_CHARTS} charts per batch")
 
     try:
-        if len(request.history) >= (MAX_QUESTIONS * 2):
-            return { "response": "I apologize, the question limit has been reached." }
+        # Repeated cities share one lookup and distinct ones are spaced out by the geocode rate limiter
+        locations = await asyncio.gather(*(get_location_and_jd(d) for d in data))
+        # Fan the CPU work out across processes instead of queueing it on the thread pool
+        loop = asyncio.get_running_loop()
+        cores = await asyncio.gather(*(
+            loop.run_in_executor(app.state.pool, _compute_chart, jd, local_dt, lat, lon)
+            for jd, local_dt, lat, lon, tz in locations
+        ))
+        return [
+            { "location": { "city": d.city, "lat": lat, "lon": lon, "tz": tz }, **core }
+            for d, (jd, local_dt, lat, lon, tz), core in zip(data, locations, cores)
+        ]
+    except Exception as e:
+        logger.error(f"Batch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        chart_context = f"""
-        Chart:
-        Ascendant: {request.chart_data['ascendant']['sign']}
-        Moon: {request.chart_data['moon_intelligence']['sign']} ({request.chart_data['moon_intelligence']['nakshatra']})
-        Current Dasha: {request.chart_data['vimshottari_timeline'][0]['lord']}
-        Planets: {str(request.chart_data['chart_data'])}
-        """
-        
-        sys_prompt = """
+def _render_chart(chart_data):
+    # Compact one-line-per-house summary for the prompt, e.g. "H1 Aries: Sun(Exalted), Mars"
+    lines = []
+    for h in range(1, 13):
+        house = chart_data[f"house_{h}"]
+        planets = ", ".join(
+            p["name"] if p["strength"] == "Neutral" else f"{p['name']}({p['strength']})"
+            for p in house["planets"]
+        )
+        lines.append(f"H{h} {house['sign']}: {planets or '-'}")
+    return "\n".join(lines)
+
+SYSTEM_PROMPT = """
         You are an expert Vedic Astrologer. 
         Analyze the chart.
         FORMATTING RULES:
@@ -352,14 +560,59 @@ def chat_with_astrologer(request: ChatRequest):
         2. Use bullet points for lists.
         3. Keep paragraphs short.
         """
-        
-        gemini_history = [{"role": "user", "parts": [f"{sys_prompt}\n\n{chart_context}"]}, {"role": "model", "parts": ["Understood."]}]
+GENERATION_CONFIG = {"candidate_count": 1}
+if MAX_OUTPUT_TOKENS: GENERATION_CONFIG["max_output_tokens"] = MAX_OUTPUT_TOKENS
+
+@lru_cache(maxsize=256)
+def _chat_prefix(chart_json):
+    # System prompt + chart context, keyed on the serialized chart so follow-up questions reuse it
+    chart_data = orjson.loads(chart_json)
+    chart_context = f"""
+        Chart:
+        Ascendant: {chart_data['ascendant']['sign']}
+        Moon: {chart_data['moon_intelligence']['sign']} ({chart_data['moon_intelligence']['nakshatra']})
+        Current Dasha: {chart_data['vimshottari_timeline'][0]['lord']}
+        Houses:
+{_render_chart(chart_data['chart_data'])}
+        """
+    return (
+        {"role": "user", "parts": [f"{SYSTEM_PROMPT}\n\n{chart_context}"]},
+        {"role": "model", "parts": ["Understood."]}
+    )
+
+# Stop reverse proxies (e.g. nginx) from buffering the stream, which would hold back the first tokens
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _sse_event(text):
+    # JSON-encode each chunk so newlines in the model output don't break SSE framing
+    return f"data: {json.dumps(text)}\n\n"
+
+async def _stream_chat(stream):
+    try:
+        async for chunk in stream:
+            yield _sse_event(chunk.text)
+    except Exception as e:
+        logger.error(f"Chat Stream Error: {e}")
+        yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+
+@app.post("/chat_with_astrologer")
+async def chat_with_astrologer(request: ChatRequest):
+    if not ai_model:
+        raise HTTPException(status_code=503, detail="AI Service is currently unavailable. Please check API Key.")
+
+    try:
+        if len(request.history) >= (MAX_QUESTIONS * 2):
+            limit_msg = _sse_event("I apologize, the question limit has been reached.")
+            return StreamingResponse(iter([limit_msg]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+        gemini_history = list(_chat_prefix(orjson.dumps(request.chart_data)))
         for msg in request.history:
             gemini_history.append({"role": "user" if msg.role == "user" else "model", "parts": [msg.text]})
 
-        chat = ai_model.start_chat(history=gemini_history)
-        response = chat.send_message(request.question)
-        return {"response": response.text}
+        gemini_history.append({"role": "user", "parts": [request.question]})
+
+        stream = await ai_model.generate_content_async(gemini_history, generation_config=GENERATION_CONFIG, stream=True)
+        return StreamingResponse(_stream_chat(stream), media_type="text/event-stream", headers=SSE_HEADERS)
 
     except Exception as e:
         logger.error(f"Chat Error: {e}")
@@ -367,4 +620,9 @@ def chat_with_astrologer(request: ChatRequest):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    # uvicorn[standard] installs uvloop + httptools; "auto" uses them where available (uvloop has no Windows build)
+    uvicorn.run(
+        "main:app", host="127.0.0.1", port=8000,
+        loop="auto", http="auto",
+        workers=WORKERS
+    )
\ No newline at end of file
@@ -17,12 +17,32 @@ export const calculateChart = async (data: any) => {
   return res.json();
 };
 
-export const chatWithAstrologer = async (payload: any) => {
+// Streams the answer as Server-Sent Events; onText receives the accumulated text so far
+export const chatWithAstrologer = async (payload: any, onText: (text: string) => void) => {
   const res = await fetch(`${API_BASE}/chat_with_astrologer`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload),
   });
-  if (!res.ok) throw new Error("Chat failed");
-  return res.json();
+  if (!res.ok || !res.body) throw new Error("Chat failed");
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop() ?? "";
+    for (const event of events) {
+      const data = event.split("\n").find((line) => line.startsWith("data: "));
+      if (!data) continue;
+      if (event.startsWith("event: error")) throw new Error(JSON.parse(data.slice(6)));
+      text += JSON.parse(data.slice(6));
+      onText(text);
+    }
+  }
+  return text;
 };
\ No newline at end of file
@@ -79,12 +79,14 @@ export default function Home() {
     setChatLoading(true);
 
     try {
-      const res = await chatWithAstrologer({
-        chart_data: chartData,
-        question: newMsg.text,
-        history: updatedHistory,
-      });
-      setChatHistory([...updatedHistory, { role: "model", text: res.response }]);
+      await chatWithAstrologer(
+        {
+          chart_data: chartData,
+          question: newMsg.text,
+          history: updatedHistory,
+        },
+        (text) => setChatHistory([...updatedHistory, { role: "model", text }])
+      );
     } catch (e) {
       setChatHistory([...updatedHistory, { role: "model", text: "Error connecting to the stars." }]);
     } finally {